@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, g, jsonify, request, send_from_directory
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
@@ -6,13 +6,28 @@ import requests
 import logging
 from datetime import datetime
 import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import base64
+import hashlib
+import functools
+import select
+import socket
+import sys
+import random
+import hmac
+import queue
+from collections import Counter, OrderedDict
 
 # Load environment variables from .env file
 # This will load from backend/.env in development or /app/.env in Docker
 load_dotenv()
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Setup logging (per-result details are logged at DEBUG)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder='./frontend' if os.path.exists('./frontend') else '../frontend', static_url_path='')
@@ -25,6 +40,120 @@ app.config['TMDB_API_KEY'] = os.getenv('TMDB_API_KEY', '')
 app.config['QBITTORRENT_URL'] = os.getenv('QBITTORRENT_URL', 'http://localhost:8080')
 app.config['QBITTORRENT_USERNAME'] = os.getenv('QBITTORRENT_USERNAME', 'admin')
 app.config['QBITTORRENT_PASSWORD'] = os.getenv('QBITTORRENT_PASSWORD', 'adminpass')
+app.config['MOVIES_PATH'] = os.getenv('MOVIES_PATH', 'C:/movies')
+app.config['SHOWS_PATH'] = os.getenv('SHOWS_PATH', 'C:/shows')
+
+# qBittorrent pool: QBITTORRENT_INSTANCES is a JSON list of
+# {"name", "url", "username", "password", "movies_path", "shows_path", "categories"};
+# without it the single instance above is used
+app.config['QBITTORRENT_POLL_INTERVAL'] = int(os.getenv('QBITTORRENT_POLL_INTERVAL', '30'))
+app.config['QBITTORRENT_MIN_FREE_GB'] = float(os.getenv('QBITTORRENT_MIN_FREE_GB', '10'))
+
+# Local media library (paths as seen by this process, defaults to the save paths)
+app.config['LIBRARY_MOVIES_DIR'] = os.getenv('LIBRARY_MOVIES_DIR', app.config['MOVIES_PATH'])
+app.config['LIBRARY_SHOWS_DIR'] = os.getenv('LIBRARY_SHOWS_DIR', app.config['SHOWS_PATH'])
+app.config['LIBRARY_SCAN_INTERVAL'] = int(os.getenv('LIBRARY_SCAN_INTERVAL', '60'))  # 0 disables
+
+# Background download queue
+app.config['JOBS_DB_PATH'] = os.getenv('JOBS_DB_PATH', 'jobs.db')
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '2'))
+app.config['JOB_MAX_ATTEMPTS'] = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+app.config['JOB_RETRY_DELAY'] = float(os.getenv('JOB_RETRY_DELAY', '5'))  # seconds, doubled per attempt
+app.config['JOB_LEASE_SECONDS'] = float(os.getenv('JOB_LEASE_SECONDS', '300'))
+
+
+def load_qbittorrent_instances():
+    """Build the qBittorrent pool from QBITTORRENT_INSTANCES or the single-instance settings"""
+    instances = []
+    raw = os.getenv('QBITTORRENT_INSTANCES', '')
+    if raw:
+        try:
+            instances = json.loads(raw)
+        except ValueError as e:
+            logger.error("Invalid QBITTORRENT_INSTANCES, using QBITTORRENT_URL: %s", e)
+            instances = []
+    
+    if not isinstance(instances, list):
+        logger.error("QBITTORRENT_INSTANCES must be a JSON list, using QBITTORRENT_URL")
+        instances = []
+    
+    valid = []
+    for instance in instances:
+        if isinstance(instance, dict) and isinstance(instance.get('url'), str) and instance['url']:
+            valid.append(instance)
+        else:
+            logger.error("Skipping QBITTORRENT_INSTANCES entry without a url: %s", instance)
+    instances = valid
+    
+    if not instances:
+        instances = [{'name': 'default', 'url': app.config['QBITTORRENT_URL']}]
+    
+    for number, instance in enumerate(instances, start=1):
+        instance.setdefault('name', f'qbittorrent-{number}')
+        instance.setdefault('username', app.config['QBITTORRENT_USERNAME'])
+        instance.setdefault('password', app.config['QBITTORRENT_PASSWORD'])
+        instance.setdefault('movies_path', app.config['MOVIES_PATH'])
+        instance.setdefault('shows_path', app.config['SHOWS_PATH'])
+        instance.setdefault('categories', [])
+        instance['url'] = instance['url'].rstrip('/')
+    
+    return instances
+
+
+app.config['QBITTORRENT_INSTANCES'] = load_qbittorrent_instances()
+
+
+def parse_class_settings(name, defaults):
+    """Parse a per-request-class setting like 'search=3,download=4' over the defaults"""
+    settings = dict(defaults)
+    for item in os.getenv(name, '').split(','):
+        if '=' not in item:
+            continue
+        request_class, value = item.split('=', 1)
+        try:
+            settings[request_class.strip()] = type(defaults.get(request_class.strip(), 0))(value)
+        except ValueError:
+            logger.error("Invalid %s entry: %s", name, item)
+    return settings
+
+
+# Admission control (per process). Waiting requests hold a gunicorn thread too, so
+# --threads must exceed the search limit plus the search queue limit by enough
+# to keep downloads and status calls running during a search burst; the
+# defaults leave 7 of the Dockerfile's 12 threads free of searches.
+app.config['ADMISSION_MAX_ACTIVE'] = int(os.getenv('ADMISSION_MAX_ACTIVE', '8'))
+app.config['ADMISSION_LIMITS'] = parse_class_settings(
+    'ADMISSION_LIMITS', {'status': 8, 'download': 4, 'enrichment': 3, 'search': 3}
+)
+app.config['ADMISSION_QUEUE_LIMITS'] = parse_class_settings(
+    'ADMISSION_QUEUE_LIMITS', {'status': 16, 'download': 16, 'enrichment': 4, 'search': 2}
+)
+app.config['ADMISSION_QUEUE_TIMEOUTS'] = parse_class_settings(
+    'ADMISSION_QUEUE_TIMEOUTS', {'status': 10.0, 'download': 10.0, 'enrichment': 1.0, 'search': 2.0}
+)
+app.config['ADMISSION_RETRY_AFTER'] = int(os.getenv('ADMISSION_RETRY_AFTER', '5'))
+
+# Sampling profiler (off unless PROFILER_SAMPLE_PERCENT > 0; /api/debug needs DEBUG_TOKEN)
+app.config['PROFILER_SAMPLE_PERCENT'] = float(os.getenv('PROFILER_SAMPLE_PERCENT', '0'))
+app.config['PROFILER_INTERVAL_MS'] = float(os.getenv('PROFILER_INTERVAL_MS', '10'))
+app.config['PROFILER_SLOW_MS'] = float(os.getenv('PROFILER_SLOW_MS', '2000'))
+app.config['PROFILER_MAX_PROFILES'] = int(os.getenv('PROFILER_MAX_PROFILES', '20'))
+app.config['DEBUG_TOKEN'] = os.getenv('DEBUG_TOKEN', '')
+
+# Upstream response cache (shared by all workers through JOBS_DB_PATH) and warm-up
+app.config['TMDB_CACHE_TTL'] = int(os.getenv('TMDB_CACHE_TTL', '86400'))
+app.config['PROWLARR_CACHE_TTL'] = int(os.getenv('PROWLARR_CACHE_TTL', '300'))
+app.config['WARMUP_REQUESTS_PER_MINUTE'] = float(os.getenv('WARMUP_REQUESTS_PER_MINUTE', '20'))  # 0 disables
+app.config['WARMUP_HISTORY_LIMIT'] = int(os.getenv('WARMUP_HISTORY_LIMIT', '25'))
+
+MAX_METADATA_RESULTS = 15
+
+# Relevance and upgrade ranking of the qualities extract_quality reports
+QUALITY_SCORES = {
+    '4K': 100, '2160p': 100, '1080p': 80, 'BluRay': 70,
+    'WEB-DL': 60, '720p': 50, 'WEBRip': 40, 'HDTV': 30,
+    '480p': 20, 'DVDRip': 10
+}
 
 
 def search_prowlarr(query, filters=None):
@@ -34,63 +163,17 @@ def search_prowlarr(query, filters=None):
         return []
     
     try:
-        # Clean the search query using guessit for better results
-        cleaned_query = clean_title_for_metadata(query, '')
-        if cleaned_query and len(cleaned_query) > 2:
-            search_query = cleaned_query
-            logger.info(f"Using cleaned query: '{cleaned_query}' instead of original: '{query}'")
-        else:
-            search_query = query
-        
-        # Prowlarr search endpoint
-        url = f"{app.config['PROWLARR_URL']}/api/v1/search"
-        
-        # Search parameters
-        params = {
-            'query': search_query,
-            'type': 'search'
-        }
+        search_query = prowlarr_search_query(query)
         
         # Add category filter if specified
+        category_id = None
         if filters and filters.get('category'):
             category_id = get_category_id(filters['category'])
-            if category_id:
-                params['categories'] = [category_id]
-        
-        # Headers with API key
-        headers = {
-            'X-Api-Key': app.config['PROWLARR_API_KEY']
-        }
         
-        logger.info(f"Searching Prowlarr for: {search_query} with filters: {filters}")
-        response = requests.get(url, params=params, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        results = response.json()
-        logger.info(f"Found {len(results)} raw results from Prowlarr")
-        
-        # Normalize results first
-        normalized_results = []
-        for torrent in results:
-            normalized = {
-                'title': torrent.get('title', 'Unknown'),  # Keep original title
-                'indexer': torrent.get('indexer', 'Unknown'),
-                'size': format_bytes(torrent.get('size', 0)),
-                'size_bytes': torrent.get('size', 0),
-                'seeders': torrent.get('seeders', 0),
-                'leechers': torrent.get('leechers', 0),
-                'magnet_link': torrent.get('magnetUrl', ''),
-                'download_url': torrent.get('downloadUrl', ''),
-                'info_url': torrent.get('infoUrl', ''),
-                'publishDate': torrent.get('publishDate', ''),
-                'category': parse_category(torrent.get('categories', [])),
-                'quality': extract_quality(torrent.get('title', '')),
-                'guid': torrent.get('guid', '')
-            }
-            
-            # Only include torrents with magnet links or download URLs
-            if normalized['magnet_link'] or normalized['download_url']:
-                normalized_results.append(normalized)
+        logger.info("Searching Prowlarr for: %s with filters: %s", search_query, filters)
+        # A copy, since the list may be shared with the in-memory cache
+        normalized_results = list(fetch_prowlarr_results(search_query, category_id))
+        logger.info("Found %d usable results from Prowlarr", len(normalized_results))
         
         # Apply advanced filtering using the new filter_torrents function
         if filters:
@@ -98,7 +181,7 @@ def search_prowlarr(query, filters=None):
         else:
             filtered_results = normalized_results
         
-        logger.info(f"Filtered to {len(filtered_results)} results")
+        logger.info("Filtered to %d results", len(filtered_results))
         return filtered_results
         
     except requests.exceptions.Timeout:
@@ -112,6 +195,69 @@ def search_prowlarr(query, filters=None):
         return []
 
 
+def prowlarr_search_query(query):
+    """Clean the search query using parse-torrent-name for better results"""
+    cleaned_query = clean_title_for_metadata(query, '')
+    if cleaned_query and len(cleaned_query) > 2:
+        logger.debug("Using cleaned query: '%s' instead of original: '%s'", cleaned_query, query)
+        return cleaned_query
+    return query
+
+
+def fetch_prowlarr_results(search_query, category_id=None):
+    """Fetch normalized Prowlarr results, served from the shared cache when fresh"""
+    cache_key = f"prowlarr:{category_id or ''}:{search_query.lower()}"
+    hit, results = cache_get(cache_key)
+    if hit:
+        return results
+    
+    # Prowlarr search endpoint
+    url = f"{app.config['PROWLARR_URL']}/api/v1/search"
+    
+    # Search parameters
+    params = {
+        'query': search_query,
+        'type': 'search'
+    }
+    if category_id:
+        params['categories'] = [category_id]
+    
+    # Headers with API key
+    headers = {
+        'X-Api-Key': app.config['PROWLARR_API_KEY']
+    }
+    
+    throttle_warmup()
+    response = requests.get(url, params=params, headers=headers, timeout=30)
+    response.raise_for_status()
+    
+    # Normalize results first; only these are cached, not the raw response
+    results = []
+    for torrent in response.json():
+        normalized = {
+            'title': torrent.get('title', 'Unknown'),  # Keep original title
+            'indexer': torrent.get('indexer', 'Unknown'),
+            'size': format_bytes(torrent.get('size', 0)),
+            'size_bytes': torrent.get('size', 0),
+            'seeders': torrent.get('seeders', 0),
+            'leechers': torrent.get('leechers', 0),
+            'magnet_link': torrent.get('magnetUrl', ''),
+            'download_url': torrent.get('downloadUrl', ''),
+            'info_url': torrent.get('infoUrl', ''),
+            'publishDate': torrent.get('publishDate', ''),
+            'category': parse_category(torrent.get('categories', [])),
+            'quality': extract_quality(torrent.get('title', '')),
+            'guid': torrent.get('guid', '')
+        }
+        
+        # Only include torrents with magnet links or download URLs
+        if normalized['magnet_link'] or normalized['download_url']:
+            results.append(normalized)
+    
+    cache_set(cache_key, results, app.config['PROWLARR_CACHE_TTL'])
+    return results
+
+
 def get_category_id(category_name):
     """Convert category name to Prowlarr category ID"""
     category_map = {
@@ -224,11 +370,7 @@ def sort_results(results, sort_by):
     else:  # relevance (default)
         # Sort by seeders and quality score
         def relevance_score(x):
-            quality_score = {
-                '4K': 100, '2160p': 100, '1080p': 80, 'BluRay': 70,
-                'WEB-DL': 60, '720p': 50, 'WEBRip': 40, 'HDTV': 30,
-                '480p': 20, 'DVDRip': 10
-            }.get(x['quality'], 0)
+            quality_score = QUALITY_SCORES.get(x['quality'], 0)
             return (x['seeders'] * 10) + quality_score
         
         return sorted(results, key=relevance_score, reverse=True)
@@ -306,47 +448,123 @@ def extract_quality(title):
     return 'Unknown'
 
 
-def qbittorrent_login():
+def qbittorrent_login(instance=None):
     """Login to qBittorrent and get session cookie"""
+    instance = instance or app.config['QBITTORRENT_INSTANCES'][0]
     try:
-        login_url = f"{app.config['QBITTORRENT_URL']}/api/v2/auth/login"
+        login_url = f"{instance['url']}/api/v2/auth/login"
         login_data = {
-            'username': app.config['QBITTORRENT_USERNAME'],
-            'password': app.config['QBITTORRENT_PASSWORD']
+            'username': instance['username'],
+            'password': instance['password']
         }
         
         session = requests.Session()
-        response = session.post(login_url, data=login_data)
+        response = session.post(login_url, data=login_data, timeout=10)
         
         if response.text == 'Ok.':
-            logger.info("Successfully logged into qBittorrent")
+            logger.info("Successfully logged into qBittorrent (%s)", instance['name'])
             return session
         else:
-            logger.error(f"Failed to login to qBittorrent: {response.text}")
+            logger.error("Failed to login to qBittorrent (%s): %s", instance['name'], response.text)
             return None
             
     except Exception as e:
-        logger.error(f"Error connecting to qBittorrent: {e}")
+        logger.error("Error connecting to qBittorrent (%s): %s", instance['name'], e)
         return None
 
 
-def add_torrent_to_qbittorrent(magnet_link, category, title):
-    """Add torrent to qBittorrent with proper settings"""
-    session = qbittorrent_login()
+def add_torrent_to_qbittorrent(magnet_link, category, title, infohash=None):
+    """Add torrent to the best qBittorrent instance, failing over to the next one.
+
+    Returns (success, message, retryable); retryable is False when qBittorrent
+    rejected the torrent itself, since no instance or retry will accept it.
+    """
+    qb_category = 'tv' if 'TV' in category or 'show' in title.lower() else 'movies'
+    candidates = choose_qbittorrent_instances(qb_category)
+    
+    if not candidates:
+        return False, "No qBittorrent instance has enough free disk space", True
+    
+    # Skip the add if a previous attempt already got through, on any instance
+    if infohash:
+        existing = find_torrent_instance(infohash)
+        if existing:
+            logger.info("Torrent already in qBittorrent (%s): %s", existing['name'], title)
+            message = "Already downloading in qBittorrent"
+            if len(app.config['QBITTORRENT_INSTANCES']) > 1:
+                message = f"{message} on {existing['name']}"
+            return True, message, False
+    
+    message = "Failed to connect to qBittorrent"
+    for instance in candidates:
+        outcome, message = add_torrent_to_instance(instance, magnet_link, qb_category, title)
+        if outcome == 'added':
+            record_qbittorrent_placement(instance)
+            if len(app.config['QBITTORRENT_INSTANCES']) > 1:
+                message = f"{message} on {instance['name']}"
+            return True, message, False
+        if outcome == 'rejected':
+            return False, message, False
+        if outcome == 'unknown':
+            # The instance may have taken it; trying another could add it twice,
+            # so leave it to the next attempt's infohash check
+            return False, message, True
+        
+        # Unreachable or erroring; take it out of rotation until the collector sees it healthy again
+        mark_qbittorrent_unhealthy(instance, message)
+    
+    return False, message, True
+
+
+def find_torrent_instance(infohash):
+    """Find the instance that already has a torrent, from the collector's view or a live check"""
+    instances = app.config['QBITTORRENT_INSTANCES']
+    for instance in instances:
+        state = qbittorrent_sync.get(instance['name'])
+        if state and infohash in state['torrents']:
+            return instance
+    
+    # The collector may not have seen a recent add yet; ask every instance that answers
+    for instance in instances:
+        session = qbittorrent_login(instance)
+        if not session:
+            continue
+        try:
+            response = session.get(
+                f"{instance['url']}/api/v2/torrents/info", params={'hashes': infohash}, timeout=10
+            )
+            if response.status_code == 200 and response.json():
+                return instance
+        except Exception as e:
+            logger.warning("Failed to check torrent on qBittorrent (%s): %s", instance['name'], e)
+        finally:
+            try:
+                session.get(f"{instance['url']}/api/v2/auth/logout", timeout=10)
+            except:
+                pass
+    return None
+
+
+def add_torrent_to_instance(instance, magnet_link, qb_category, title):
+    """Add torrent to one qBittorrent instance with proper settings.
+
+    Returns (outcome, message) where outcome is 'added', 'rejected' (qBittorrent
+    refused the torrent), 'unavailable' (login, connection or server error) or
+    'unknown' (the add was sent but timed out, so it may have gone through).
+    """
+    session = qbittorrent_login(instance)
     if not session:
-        return False, "Failed to connect to qBittorrent"
+        return 'unavailable', "Failed to connect to qBittorrent"
     
     try:
         # Determine save path based on category
-        if 'TV' in category or 'show' in title.lower():
-            save_path = 'C:/shows'
-            qb_category = 'tv'
+        if qb_category == 'tv':
+            save_path = instance['shows_path']
         else:
-            save_path = 'C:/movies'
-            qb_category = 'movies'
+            save_path = instance['movies_path']
         
         # Add torrent
-        add_url = f"{app.config['QBITTORRENT_URL']}/api/v2/torrents/add"
+        add_url = f"{instance['url']}/api/v2/torrents/add"
         torrent_params = {
             'urls': magnet_link,
             'savepath': save_path,
@@ -355,26 +573,323 @@ def add_torrent_to_qbittorrent(magnet_link, category, title):
             'firstLastPiecePrio': 'true',   # Prioritize first and last pieces
         }
         
-        response = session.post(add_url, data=torrent_params)
+        try:
+            response = session.post(add_url, data=torrent_params, timeout=30)
+        except requests.exceptions.ReadTimeout as e:
+            logger.error("Adding torrent timed out (%s): %s", instance['name'], e)
+            return 'unknown', "qBittorrent did not confirm the download in time"
+        
+        # qBittorrent answers "Fails." with a 200 when it can't use the link
+        if response.status_code == 200 and response.text.strip() != 'Fails.':
+            logger.info("Successfully added torrent: %s to %s (%s)", title, save_path, instance['name'])
+            return 'added', f"Download started! Saving to {save_path}"
         
-        if response.status_code == 200:
-            logger.info(f"Successfully added torrent: {title} to {save_path}")
-            return True, f"Download started! Saving to {save_path}"
-        else:
-            logger.error(f"Failed to add torrent: {response.status_code} - {response.text}")
-            return False, "Failed to add torrent to qBittorrent"
+        logger.error("Failed to add torrent (%s): %s - %s", instance['name'], response.status_code, response.text)
+        if response.status_code >= 500 or response.status_code in (401, 403):
+            return 'unavailable', "Failed to add torrent to qBittorrent"
+        return 'rejected', "qBittorrent rejected the torrent"
             
     except Exception as e:
-        logger.error(f"Error adding torrent: {e}")
-        return False, f"Error: {str(e)}"
+        logger.error("Error adding torrent (%s): %s", instance['name'], e)
+        return 'unavailable', f"Error: {str(e)}"
     finally:
         # Logout
         try:
-            session.get(f"{app.config['QBITTORRENT_URL']}/api/v2/auth/logout")
+            session.get(f"{instance['url']}/api/v2/auth/logout", timeout=10)
         except:
             pass
 
 
+# Admission control
+#
+# Every request class has its own concurrency limit and they share a total
+# that leaves gunicorn threads free for cheap calls. When slots free up,
+# waiting downloads and status checks go before enrichment, and enrichment
+# before searches. Searches that can't get a slot quickly are shed with
+# Retry-After instead of piling up, and a search whose client went away
+# gives up its place.
+
+ADMISSION_PRIORITIES = {'status': 0, 'download': 0, 'enrichment': 1, 'search': 2}
+
+admission_condition = threading.Condition()
+admission_stats = {
+    request_class: {'active': 0, 'waiting': 0, 'admitted': 0, 'shed': 0, 'cancelled': 0}
+    for request_class in ADMISSION_PRIORITIES
+}
+
+
+def admission_has_slot(request_class):
+    """Check whether a request of this class may start now (caller holds the condition)"""
+    limits = app.config['ADMISSION_LIMITS']
+    total_active = sum(stats['active'] for stats in admission_stats.values())
+    if total_active >= app.config['ADMISSION_MAX_ACTIVE']:
+        return False
+    if admission_stats[request_class]['active'] >= limits[request_class]:
+        return False
+    
+    # Higher-priority waiters that could run go first
+    priority = ADMISSION_PRIORITIES[request_class]
+    for other, stats in admission_stats.items():
+        if (stats['waiting'] and ADMISSION_PRIORITIES[other] < priority
+                and stats['active'] < limits[other]):
+            return False
+    return True
+
+
+def acquire_admission(request_class, should_cancel=None):
+    """Wait for a slot; returns 'admitted', 'shed' or 'cancelled'"""
+    deadline = time.time() + app.config['ADMISSION_QUEUE_TIMEOUTS'][request_class]
+    stats = admission_stats[request_class]
+    
+    with admission_condition:
+        if not admission_has_slot(request_class):
+            if stats['waiting'] >= app.config['ADMISSION_QUEUE_LIMITS'][request_class]:
+                stats['shed'] += 1
+                return 'shed'
+            
+            stats['waiting'] += 1
+            try:
+                while not admission_has_slot(request_class):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        stats['shed'] += 1
+                        return 'shed'
+                    if should_cancel and should_cancel():
+                        stats['cancelled'] += 1
+                        return 'cancelled'
+                    admission_condition.wait(min(remaining, 0.25))
+            finally:
+                stats['waiting'] -= 1
+                # Our leaving the queue may unblock lower-priority waiters
+                admission_condition.notify_all()
+        
+        stats['active'] += 1
+        stats['admitted'] += 1
+        return 'admitted'
+
+
+def release_admission(request_class):
+    """Give a slot back and wake the waiters"""
+    with admission_condition:
+        admission_stats[request_class]['active'] -= 1
+        admission_condition.notify_all()
+
+
+def client_disconnected():
+    """Check whether the client of the current request has closed its connection"""
+    sock = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        # Readable with nothing to read means the peer closed the connection
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except ConnectionError:
+        return True
+    except (OSError, ValueError):
+        # Can't tell (TLS sockets refuse MSG_PEEK, for one); assume the client is still there
+        return False
+
+
+def record_cancelled(request_class):
+    """Count a request abandoned after admission because its client left"""
+    with admission_condition:
+        admission_stats[request_class]['cancelled'] += 1
+
+
+def admission_controlled(request_class):
+    """Route decorator running the view inside an admission slot for its class"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            should_cancel = client_disconnected if request_class == 'search' else None
+            outcome = acquire_admission(request_class, should_cancel)
+            
+            if outcome == 'cancelled':
+                return jsonify({'error': 'Client disconnected'}), 499
+            if outcome == 'shed':
+                logger.warning("Shedding %s request: server busy", request_class)
+                response = jsonify({
+                    'error': 'Server busy',
+                    'message': 'Too many requests in progress, please retry shortly'
+                })
+                response.status_code = 503
+                response.headers['Retry-After'] = str(app.config['ADMISSION_RETRY_AFTER'])
+                return response
+            
+            try:
+                return view(*args, **kwargs)
+            finally:
+                release_admission(request_class)
+        return wrapper
+    return decorator
+
+
+# Sampling profiler
+#
+# A share of requests (PROFILER_SAMPLE_PERCENT) is registered with a sampler
+# thread that reads the request thread's stack every PROFILER_INTERVAL_MS. The
+# thread sleeps while nothing is registered, so unsampled traffic pays only a
+# random() call. Requests slower than PROFILER_SLOW_MS keep their samples as
+# collapsed stacks ("frame;frame;frame count", the input format of
+# flamegraph.pl and speedscope). The runtime settings and the captured profiles
+# live in the SQLite database, so every gunicorn worker follows the same switch
+# and /api/debug/profiles sees all captures, newest PROFILER_MAX_PROFILES kept.
+
+PROFILER_SETTINGS_REFRESH = 5   # seconds between re-reads of the shared settings
+
+profiler_lock = threading.Lock()
+profiler_active = {}        # thread ident -> Counter of collapsed stacks
+profiler_wakeup = threading.Event()
+profiler_settings = {
+    'sample_percent': app.config['PROFILER_SAMPLE_PERCENT'],
+    'slow_ms': app.config['PROFILER_SLOW_MS'],
+    'loaded': 0.0
+}
+profiler_thread = None
+
+
+def current_profiler_settings():
+    """Return (sample_percent, slow_ms), re-reading the shared settings every few seconds"""
+    now = time.time()
+    if now - profiler_settings['loaded'] >= PROFILER_SETTINGS_REFRESH:
+        profiler_settings['loaded'] = now
+        try:
+            conn = get_jobs_db()
+            try:
+                rows = conn.execute(
+                    "SELECT key, value FROM settings WHERE key IN ('profiler_sample_percent', 'profiler_slow_ms')"
+                ).fetchall()
+            finally:
+                conn.close()
+            for row in rows:
+                profiler_settings[row['key'][len('profiler_'):]] = float(row['value'])
+        except sqlite3.Error as e:
+            logger.warning("Failed to load profiler settings: %s", e)
+    return profiler_settings['sample_percent'], profiler_settings['slow_ms']
+
+
+def save_profile(profile):
+    """Store a captured profile, keeping only the newest PROFILER_MAX_PROFILES"""
+    conn = get_jobs_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(
+            'INSERT INTO profiles (id, method, path, started, duration_ms, samples, stacks) '
+            'VALUES (:id, :method, :path, :started, :duration_ms, :samples, :stacks)',
+            profile
+        )
+        conn.execute(
+            'DELETE FROM profiles WHERE id NOT IN (SELECT id FROM profiles ORDER BY started DESC LIMIT ?)',
+            (app.config['PROFILER_MAX_PROFILES'],)
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def collapse_stack(frame):
+    """Render a frame chain as a root-first collapsed stack"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def run_profiler_sampler():
+    """Background loop sampling the stacks of profiled request threads"""
+    while True:
+        profiler_wakeup.wait()
+        with profiler_lock:
+            targets = dict(profiler_active)
+            if not targets:
+                profiler_wakeup.clear()
+        if not targets:
+            continue
+        
+        frames = sys._current_frames()
+        for ident, samples in targets.items():
+            frame = frames.get(ident)
+            if frame is not None:
+                samples[collapse_stack(frame)] += 1
+        del frames
+        
+        time.sleep(app.config['PROFILER_INTERVAL_MS'] / 1000)
+
+
+def start_profiler_sampler():
+    """Start the sampler thread once per process"""
+    global profiler_thread
+    if profiler_thread:
+        return
+    profiler_thread = threading.Thread(target=run_profiler_sampler, name='profiler-sampler', daemon=True)
+    profiler_thread.start()
+
+
+@app.before_request
+def start_request_profile():
+    """Register a sampled share of requests with the profiler"""
+    g.request_started = time.time()
+    percent, _ = current_profiler_settings()
+    if percent <= 0 or request.path.startswith('/api/debug'):
+        return
+    if random.random() * 100 >= percent:
+        return
+    
+    start_profiler_sampler()
+    g.profile_ident = threading.get_ident()
+    with profiler_lock:
+        profiler_active[g.profile_ident] = Counter()
+        profiler_wakeup.set()
+
+
+@app.teardown_request
+def finish_request_profile(error=None):
+    """Keep the samples of a profiled request if it was slow"""
+    ident = g.pop('profile_ident', None)
+    if ident is None:
+        return
+    with profiler_lock:
+        samples = profiler_active.pop(ident, None)
+    
+    duration_ms = (time.time() - g.request_started) * 1000
+    _, slow_ms = current_profiler_settings()
+    if not samples or duration_ms < slow_ms:
+        return
+    
+    profile = {
+        'id': uuid.uuid4().hex,
+        'method': request.method,
+        'path': request.path,
+        'started': g.request_started,
+        'duration_ms': round(duration_ms, 1),
+        'samples': sum(samples.values()),
+        'stacks': '\n'.join(f"{stack} {count}" for stack, count in samples.most_common())
+    }
+    try:
+        save_profile(profile)
+    except sqlite3.Error as e:
+        logger.warning("Failed to store profile: %s", e)
+        return
+    logger.warning("Captured profile %s for slow request %s %s (%.0f ms)",
+                   profile['id'], request.method, request.path, duration_ms)
+
+
+def debug_authorized():
+    """Check the X-Debug-Token header; debug endpoints are off without DEBUG_TOKEN"""
+    token = app.config['DEBUG_TOKEN']
+    supplied = request.headers.get('X-Debug-Token', '')
+    return bool(token) and hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8'))
+
+
 @app.route('/')
 def index():
     """Serve the frontend application"""
@@ -382,12 +897,14 @@ def index():
 
 
 @app.route('/api/health')
+@admission_controlled('status')
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'service': 'TorTrack API'})
 
 
 @app.route('/api/search', methods=['POST'])
+@admission_controlled('search')
 def search():
     """Search for torrents using Prowlarr with advanced filtering"""
     data = request.get_json()
@@ -398,7 +915,7 @@ def search():
         return jsonify({'error': 'No search query provided'}), 400
     
     # Log the filters being applied
-    logger.info(f"Search request - Query: '{query}', Filters: {filters}")
+    logger.info("Search request - Query: '%s', Filters: %s", query, filters)
     
     # Check if Prowlarr is configured
     if not app.config['PROWLARR_API_KEY']:
@@ -411,14 +928,32 @@ def search():
     results = search_prowlarr(query, filters)
     
     # Log the results count
-    logger.info(f"Found {len(results)} results after filtering")
+    logger.info("Found %d results after filtering", len(results))
+    
+    # Don't spend TMDb calls on a client that already gave up
+    if client_disconnected():
+        record_cancelled('search')
+        return jsonify({'error': 'Client disconnected'}), 499
     
     # Enrich results with TMDb metadata AFTER filtering to preserve metadata
     if results:
-        enriched_results = enrich_torrent_results(results)
+        if acquire_admission('enrichment') == 'admitted':
+            try:
+                enriched_results = enrich_torrent_results(results)
+            finally:
+                release_admission('enrichment')
+        else:
+            # Too many enrichments in flight; answer with the plain results
+            enriched_results = enrich_torrent_results(results, max_metadata_results=0)
     else:
         enriched_results = []
     
+    # Flag releases we already have on disk (in-memory lookup, no filesystem access)
+    annotate_library_status(enriched_results)
+    
+    # Remembered so the next restart can warm the metadata cache for it
+    record_search(query, enriched_results[0]['category'] if enriched_results else '')
+    
     return jsonify({
         'query': query,
         'results': enriched_results,
@@ -427,9 +962,20 @@ def search():
     })
 
 
+@app.route('/api/library')
+@admission_controlled('status')
+def library_status():
+    """Report the state of the local media library index"""
+    with library_lock:
+        stats = dict(library_stats)
+        stats['files'] = len(library_files)
+    return jsonify(stats)
+
+
 @app.route('/api/download', methods=['POST'])
+@admission_controlled('download')
 def download():
-    """Trigger download via qBittorrent"""
+    """Queue a download for the background workers"""
     data = request.get_json()
     magnet_link = data.get('magnet', '')
     title = data.get('title', 'Unknown')
@@ -438,19 +984,147 @@ def download():
     if not magnet_link:
         return jsonify({'error': 'No magnet link provided'}), 400
     
-    # Add torrent to qBittorrent
-    success, message = add_torrent_to_qbittorrent(magnet_link, category, title)
-    
-    if success:
-        return jsonify({
-            'success': True,
-            'message': message
-        })
-    else:
+    try:
+        job, created = enqueue_download_job(magnet_link, category, title)
+    except sqlite3.Error as e:
+        logger.error("Failed to queue download: %s", e)
         return jsonify({
             'success': False,
-            'error': message
+            'error': 'Failed to queue download'
         }), 500
+    
+    # Other seasons and qualities of this title are likely next
+    schedule_warmup('related', title, category)
+    
+    return jsonify({
+        'success': True,
+        'message': 'Download queued' if created else f"Download already {job['status']}",
+        'job_id': job['id'],
+        'status': job['status']
+    }), 202
+
+
+@app.route('/api/qbittorrent')
+@admission_controlled('status')
+def qbittorrent_status():
+    """Report cached load and health for each qBittorrent instance"""
+    with qbittorrent_lock:
+        instances = [
+            dict(qbittorrent_stats.get(instance['name'], {}), name=instance['name'], url=instance['url'])
+            for instance in app.config['QBITTORRENT_INSTANCES']
+        ]
+    return jsonify({'instances': instances})
+
+
+@app.route('/api/admission')
+def admission_status():
+    """Report slots in use, queue depth and shed counts per request class"""
+    with admission_condition:
+        classes = {
+            request_class: dict(
+                stats,
+                limit=app.config['ADMISSION_LIMITS'][request_class],
+                queue_limit=app.config['ADMISSION_QUEUE_LIMITS'][request_class]
+            )
+            for request_class, stats in admission_stats.items()
+        }
+    return jsonify({'max_active': app.config['ADMISSION_MAX_ACTIVE'], 'classes': classes})
+
+
+@app.route('/api/debug/profiles')
+def list_profiles():
+    """List captured slow-request profiles"""
+    if not debug_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    conn = get_jobs_db()
+    try:
+        rows = conn.execute(
+            'SELECT id, method, path, started, duration_ms, samples FROM profiles ORDER BY started DESC'
+        ).fetchall()
+    finally:
+        conn.close()
+    
+    profiles = []
+    for row in rows:
+        profile = dict(row)
+        profile['started'] = datetime.fromtimestamp(profile['started']).isoformat()
+        profiles.append(profile)
+    
+    sample_percent, slow_ms = current_profiler_settings()
+    return jsonify({
+        'sample_percent': sample_percent,
+        'slow_ms': slow_ms,
+        'profiles': profiles
+    })
+
+
+@app.route('/api/debug/profiles/<profile_id>')
+def get_profile(profile_id):
+    """Return a profile's collapsed stacks, ready for flamegraph.pl or speedscope"""
+    if not debug_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    conn = get_jobs_db()
+    try:
+        row = conn.execute('SELECT stacks FROM profiles WHERE id = ?', (profile_id,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return jsonify({'error': 'Profile not found'}), 404
+    return app.response_class(row['stacks'] + '\n', mimetype='text/plain')
+
+
+@app.route('/api/debug/profiler', methods=['POST'])
+def configure_profiler():
+    """Change the sampling percentage and slow-request threshold for all workers"""
+    if not debug_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json() or {}
+    updates = {}
+    try:
+        if 'sample_percent' in data:
+            updates['sample_percent'] = min(max(float(data['sample_percent']), 0), 100)
+        if 'slow_ms' in data:
+            updates['slow_ms'] = max(float(data['slow_ms']), 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'sample_percent and slow_ms must be numbers'}), 400
+    
+    conn = get_jobs_db()
+    try:
+        for key, value in updates.items():
+            conn.execute(
+                'INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (f'profiler_{key}', str(value))
+            )
+    finally:
+        conn.close()
+    
+    # Other workers pick the change up within PROFILER_SETTINGS_REFRESH seconds
+    profiler_settings['loaded'] = 0.0
+    sample_percent, slow_ms = current_profiler_settings()
+    logger.info("Profiler set to %s%% of requests, capturing above %s ms", sample_percent, slow_ms)
+    return jsonify({
+        'sample_percent': sample_percent,
+        'slow_ms': slow_ms
+    })
+
+
+@app.route('/api/warmup')
+@admission_controlled('status')
+def warmup_status():
+    """Report warm-up queue depth and upstream requests spent"""
+    with warmup_lock:
+        stats = dict(warmup_stats, queued=warmup_queue.qsize())
+    stats['requests_per_minute'] = app.config['WARMUP_REQUESTS_PER_MINUTE']
+    return jsonify(stats)
+
+
+@app.route('/api/jobs/<job_id>')
+@admission_controlled('status')
+def job_status(job_id):
+    """Report the status of a queued download"""
+    job = get_download_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
 
 
 def is_tv_show(category):
@@ -527,7 +1201,7 @@ def clean_title_for_metadata(title, category):
             words = clean_title.split()
             clean_title = ' '.join(words[:4])  # Take first 4 words
         
-        logger.info(f"Cleaned title '{title}' to '{clean_title}' using parse-torrent-name")
+        logger.debug("Cleaned title '%s' to '%s' using parse-torrent-name", title, clean_title)
         return clean_title
         
     except ImportError:
@@ -553,10 +1227,10 @@ def clean_title_for_metadata(title, category):
         words = cleaned.split()
         cleaned = ' '.join(words[:4])
         
-        logger.info(f"Cleaned title '{title}' to '{cleaned}' using fallback")
+        logger.debug("Cleaned title '%s' to '%s' using fallback", title, cleaned)
         return cleaned
     except Exception as e:
-        logger.error(f"Error cleaning title '{title}': {e}")
+        logger.error("Error cleaning title '%s': %s", title, e)
         return title[:50]  # Return first 50 characters as fallback
 
 
@@ -571,7 +1245,7 @@ def search_tmdb_metadata(title, category):
         cleaned_title = clean_title_for_metadata(title, category)
         
         if not cleaned_title or len(cleaned_title) < 2:
-            logger.info(f"Title too short after cleaning: '{cleaned_title}'")
+            logger.debug("Title too short after cleaning: '%s'", cleaned_title)
             return None
         
         # Try to extract year from the original title using parse-torrent-name
@@ -586,6 +1260,11 @@ def search_tmdb_metadata(title, category):
         # Determine search type based on category
         search_type = 'tv' if 'tv' in category.lower() or 'show' in category.lower() else 'movie'
         
+        cache_key = tmdb_cache_key(search_type, cleaned_title, year)
+        hit, metadata = cache_get(cache_key)
+        if hit:
+            return metadata
+        
         # TMDb search endpoint
         url = f"https://api.themoviedb.org/3/search/{search_type}"
         params = {
@@ -599,7 +1278,8 @@ def search_tmdb_metadata(title, category):
         if year:
             params['year'] = year
         
-        logger.info(f"Searching TMDb for: {cleaned_title} (type: {search_type}, year: {year})")
+        logger.debug("Searching TMDb for: %s (type: %s, year: %s)", cleaned_title, search_type, year)
+        throttle_warmup()
         response = requests.get(url, params=params, timeout=3)  # Reduced timeout to 3 seconds
         response.raise_for_status()
         
@@ -608,34 +1288,46 @@ def search_tmdb_metadata(title, category):
         
         if results:
             # Get the first (most relevant) result
-            result = results[0]
-            
-            metadata = {
-                'title': result.get('title') or result.get('name', 'Unknown'),
-                'year': extract_year(result.get('release_date') or result.get('first_air_date')),
-                'overview': result.get('overview', 'No overview available.'),
-                'poster_url': f"https://image.tmdb.org/t/p/w500{result.get('poster_path')}" if result.get('poster_path') else None,
-                'tmdb_id': result.get('id'),
-                'type': search_type
-            }
-            
-            logger.info(f"Found TMDb metadata for: {metadata['title']} ({metadata['year']})")
-            return metadata
+            metadata = tmdb_result_to_metadata(results[0], search_type)
+            logger.debug("Found TMDb metadata for: %s (%s)", metadata['title'], metadata['year'])
         else:
-            logger.info(f"No TMDb results found for: {cleaned_title}")
-            return None
+            metadata = None
+            logger.debug("No TMDb results found for: %s", cleaned_title)
+        
+        # "Not found" is cached too; errors and timeouts are not
+        cache_set(cache_key, metadata, app.config['TMDB_CACHE_TTL'])
+        return metadata
             
     except requests.exceptions.Timeout:
         logger.warning("TMDb request timed out")
         return None
     except requests.exceptions.RequestException as e:
-        logger.warning(f"TMDb request failed: {e}")
+        logger.warning("TMDb request failed: %s", e)
         return None
     except Exception as e:
-        logger.warning(f"Unexpected error searching TMDb: {e}")
+        logger.warning("Unexpected error searching TMDb: %s", e)
         return None
 
 
+def tmdb_cache_key(search_type, title, year=None):
+    """Cache key for a TMDb lookup, with the title cut at its year like library titles"""
+    title, title_year = normalize_release_title(title)
+    year = year or title_year
+    return f"tmdb:{search_type}:{title}:{year or ''}"
+
+
+def tmdb_result_to_metadata(result, search_type):
+    """Convert a TMDb search or trending result to our metadata format"""
+    return {
+        'title': result.get('title') or result.get('name', 'Unknown'),
+        'year': extract_year(result.get('release_date') or result.get('first_air_date')),
+        'overview': result.get('overview', 'No overview available.'),
+        'poster_url': f"https://image.tmdb.org/t/p/w500{result.get('poster_path')}" if result.get('poster_path') else None,
+        'tmdb_id': result.get('id'),
+        'type': search_type
+    }
+
+
 def extract_year(date_string):
     """Extract year from date string"""
     if date_string:
@@ -646,12 +1338,11 @@ def extract_year(date_string):
     return 'Unknown'
 
 
-def enrich_torrent_results(results):
+def enrich_torrent_results(results, max_metadata_results=MAX_METADATA_RESULTS):
     """Enrich torrent results with TMDb metadata (optimized for filtered results)"""
     enriched_results = []
     
     # Process first 15 results for metadata (increased from 10)
-    max_metadata_results = 15
     results_to_enrich = results[:max_metadata_results]
     
     # Simple cache to avoid duplicate API calls
@@ -670,7 +1361,7 @@ def enrich_torrent_results(results):
                 metadata = search_tmdb_metadata(result['title'], result['category'])
                 processed_titles[cache_key] = metadata
             except Exception as e:
-                logger.warning(f"Metadata fetch failed for {result['title']}: {e}")
+                logger.warning("Metadata fetch failed for %s: %s", result['title'], e)
                 metadata = None
         
         # Merge metadata with torrent data
@@ -710,7 +1401,7 @@ def enrich_torrent_results(results):
         })
         enriched_results.append(enriched_result)
     
-    logger.info(f"Enriched {len(enriched_results)} results (metadata for first {max_metadata_results})")
+    logger.info("Enriched %d results (metadata for first %d)", len(enriched_results), max_metadata_results)
     return enriched_results
 
 
@@ -774,11 +1465,7 @@ def filter_torrents(torrents, filters):
     # If no filters applied, sort by relevance (seeders + quality)
     if not filters.get('size') and not filters.get('seeders'):
         def relevance_score(x):
-            quality_score = {
-                '4K': 100, '2160p': 100, '1080p': 80, 'BluRay': 70,
-                'WEB-DL': 60, '720p': 50, 'WEBRip': 40, 'HDTV': 30,
-                '480p': 20, 'DVDRip': 10
-            }.get(x.get('quality', ''), 0)
+            quality_score = QUALITY_SCORES.get(x.get('quality', ''), 0)
             return (x.get('seeders', 0) * 10) + quality_score
         
         filtered.sort(key=relevance_score, reverse=True)
@@ -787,5 +1474,978 @@ def filter_torrents(torrents, filters):
     return filtered[:100]  # Limit to 100 results for speed
 
 
+# Local media library index
+#
+# The movie and show directories are walked once at startup and then refreshed
+# incrementally: a directory is only re-listed when its mtime changes (which is
+# how the filesystem signals that entries were added, removed or renamed), and
+# only new files are parsed. Search results are annotated from the in-memory
+# lookup, so requests never touch the filesystem.
+
+VIDEO_EXTENSIONS = {'.mkv', '.mp4', '.avi', '.m4v', '.mov', '.wmv', '.ts', '.webm'}
+
+SEASON_EPISODE_PATTERN = re.compile(r'\bS(\d{1,2})(?:\s*E(\d{1,3}))?\b|\bSeason\s*(\d{1,2})\b', re.IGNORECASE)
+YEAR_PATTERN = re.compile(r'\b(19\d{2}|20\d{2})\b')
+# Applied to normalized titles: season, episode, series pack and resolution tokens end the title
+TITLE_CUTOFF_PATTERN = re.compile(
+    r'\b(?:s\d{1,2}(?:e\d{1,3})?|season \d+|(?:the )?complete(?: series| collection)?|full series|series pack'
+    r'|2160p|1080p|720p|480p|4k|uhd)\b.*'
+)
+
+library_lock = threading.Lock()
+library_files = {}    # file path -> parsed entry
+library_dirs = {}     # directory path -> (mtime, subdirectories, video files)
+library_lookup = {}   # lookup key -> {file path: quality}
+library_stats = {'last_scan': None, 'scan_seconds': None, 'movies': 0, 'episodes': 0}
+library_thread = None
+
+
+def parse_release_name(name):
+    """Parse a release or file name into title, year, season, episode and quality"""
+    base, ext = os.path.splitext(name)
+    if ext.lower() in VIDEO_EXTENSIONS:
+        name = base
+    
+    title, title_year = normalize_release_title(clean_title_for_metadata(name, ''))
+    year = season = episode = None
+    
+    try:
+        import PTN
+        parsed = PTN.parse(name)
+        year = parsed.get('year')
+        season = parsed.get('season')
+        episode = parsed.get('episode')
+    except ImportError:
+        pass
+    
+    # Multi-season/episode releases come back as lists; index them by the first one
+    if isinstance(season, list):
+        season = season[0] if season else None
+    if isinstance(episode, list):
+        episode = episode[0] if episode else None
+    
+    # parse-torrent-name misses season packs ("Show.S02.COMPLETE") and some years
+    if season is None:
+        match = SEASON_EPISODE_PATTERN.search(name)
+        if match:
+            season = int(match.group(1) or match.group(3))
+            if match.group(2):
+                episode = int(match.group(2))
+    if year is None:
+        year = title_year
+    if year is None:
+        match = YEAR_PATTERN.search(name)
+        if match:
+            year = int(match.group(1))
+    
+    return {
+        'title': title,
+        'year': int(year) if year else None,
+        'season': int(season) if season is not None else None,
+        'episode': int(episode) if episode is not None else None,
+        'quality': extract_quality(name)
+    }
+
+
+def normalize_release_title(title):
+    """Normalize a parsed title and cut it at the year, season or resolution left in it.
+
+    parse-torrent-name 1.1.0 doesn't recognise years after 2019, so titles like
+    "Dune Part Two 2024 2160p" reach us with the year still attached. Returns
+    (title, year) where year is the one cut off, or None.
+    """
+    title = normalize_library_title(title)
+    year = None
+    
+    # A year at the very start is part of the title ("2012", "1917")
+    match = YEAR_PATTERN.search(title, 1)
+    if match:
+        year = int(match.group(1))
+        title = title[:match.start()].strip()
+    
+    trimmed = TITLE_CUTOFF_PATTERN.sub('', title).strip()
+    return trimmed or title, year
+
+
+def normalize_library_title(title):
+    """Normalize a title so release names and file names compare equal"""
+    title = (title or '').lower().replace('&', ' and ')
+    title = re.sub(r'[^a-z0-9]+', ' ', title)
+    return title.strip()
+
+
+def library_keys(entry, kind):
+    """Build the lookup keys a library file is reachable under"""
+    title = entry['title']
+    if entry['season'] is not None:
+        keys = [('show', title), ('season', title, entry['season'])]
+        if entry['episode'] is not None:
+            keys.append(('episode', title, entry['season'], entry['episode']))
+        else:
+            # Only a file without an episode number stands for the whole season
+            keys.append(('season_pack', title, entry['season']))
+        return keys
+    if kind == 'shows':
+        return [('show', title)]
+    return [('movie', title, entry['year']), ('movie', title, '*')]
+
+
+def add_library_file(path, root, kind):
+    """Parse a video file and add it to the index"""
+    entry = parse_release_name(os.path.basename(path))
+    
+    # Files like "Season 1/S01E02.mkv" carry no title; fall back to the top-level folder
+    if not entry['title'] or SEASON_EPISODE_PATTERN.fullmatch(entry['title']):
+        top_folder = os.path.relpath(path, root).split(os.sep)[0]
+        folder_entry = parse_release_name(top_folder)
+        entry['title'] = folder_entry['title']
+        if entry['year'] is None:
+            entry['year'] = folder_entry['year']
+    
+    if not entry['title']:
+        return
+    
+    entry['kind'] = kind
+    with library_lock:
+        library_files[path] = entry
+        for key in library_keys(entry, kind):
+            library_lookup.setdefault(key, {})[path] = entry['quality']
+
+
+def remove_library_file(path):
+    """Drop a file from the index"""
+    with library_lock:
+        entry = library_files.pop(path, None)
+        if not entry:
+            return
+        for key in library_keys(entry, entry['kind']):
+            owners = library_lookup.get(key)
+            if owners is not None:
+                owners.pop(path, None)
+                if not owners:
+                    del library_lookup[key]
+
+
+def scan_library_dir(path, root, kind, seen_dirs):
+    """Walk a directory, re-listing only those whose mtime changed since the last scan"""
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return
+    
+    seen_dirs.add(path)
+    cached = library_dirs.get(path)
+    
+    if cached and cached[0] == mtime:
+        subdirs = cached[1]
+    else:
+        subdirs, files = [], []
+        try:
+            with os.scandir(path) as entries:
+                for item in entries:
+                    if item.is_dir(follow_symlinks=False):
+                        subdirs.append(item.path)
+                    elif os.path.splitext(item.name)[1].lower() in VIDEO_EXTENSIONS:
+                        files.append(item.path)
+        except OSError as e:
+            logger.warning("Could not list library directory %s: %s", path, e)
+            return
+        
+        old_files = set(cached[2]) if cached else set()
+        for removed in old_files.difference(files):
+            remove_library_file(removed)
+        for added in set(files).difference(old_files):
+            add_library_file(added, root, kind)
+        
+        library_dirs[path] = (mtime, subdirs, files)
+    
+    for subdir in subdirs:
+        scan_library_dir(subdir, root, kind, seen_dirs)
+
+
+def refresh_library_index():
+    """Bring the index up to date with the movie and show directories"""
+    started = time.time()
+    seen_dirs = set()
+    
+    roots = [
+        (app.config['LIBRARY_MOVIES_DIR'], 'movies'),
+        (app.config['LIBRARY_SHOWS_DIR'], 'shows')
+    ]
+    for root, kind in roots:
+        if root:
+            scan_library_dir(root, root, kind, seen_dirs)
+    
+    # Directories that disappeared take their files with them
+    for path in [d for d in library_dirs if d not in seen_dirs]:
+        for file_path in library_dirs.pop(path)[2]:
+            remove_library_file(file_path)
+    
+    with library_lock:
+        library_stats['last_scan'] = datetime.now().isoformat()
+        library_stats['scan_seconds'] = round(time.time() - started, 3)
+        library_stats['movies'] = sum(1 for e in library_files.values() if e['season'] is None)
+        library_stats['episodes'] = len(library_files) - library_stats['movies']
+
+
+def run_library_indexer():
+    """Background loop keeping the library index fresh"""
+    while True:
+        try:
+            refresh_library_index()
+        except Exception as e:
+            logger.error("Library index refresh failed: %s", e)
+        time.sleep(app.config['LIBRARY_SCAN_INTERVAL'])
+
+
+def start_library_indexer():
+    """Start the library indexer thread once per process"""
+    global library_thread
+    if library_thread or app.config['LIBRARY_SCAN_INTERVAL'] <= 0:
+        return
+    library_thread = threading.Thread(target=run_library_indexer, name='library-indexer', daemon=True)
+    library_thread.start()
+
+
+def find_owned_qualities(entry, category):
+    """Return (qualities of library files matching a parsed release, files owned of a partial pack)"""
+    title = entry['title']
+    if not title:
+        return [], 0
+    
+    # Packs are only owned as packs; loose episodes make them partial
+    partial_key = None
+    if entry['season'] is not None:
+        if entry['episode'] is not None:
+            keys = [('episode', title, entry['season'], entry['episode'])]
+        else:
+            keys = [('season_pack', title, entry['season'])]
+            partial_key = ('season', title, entry['season'])
+    elif is_tv_show(category):
+        keys = []
+        partial_key = ('show', title)
+    elif entry['year']:
+        keys = [('movie', title, entry['year']), ('movie', title, None)]
+    else:
+        keys = [('movie', title, '*')]
+    
+    owned = []
+    partial = 0
+    with library_lock:
+        for key in keys:
+            owned.extend(library_lookup.get(key, {}).values())
+        if not owned and partial_key:
+            partial = len(library_lookup.get(partial_key, {}))
+    return owned, partial
+
+
+def annotate_library_status(results):
+    """Mark results we own ('owned'), own in a lower quality ('upgrade') or own part of ('partial')"""
+    for result in results:
+        entry = parse_release_name(result['title'])
+        owned, partial = find_owned_qualities(entry, result.get('category', ''))
+        result['owned_episodes'] = partial
+        
+        if not owned:
+            result['library_status'] = 'partial' if partial else None
+            result['owned_quality'] = None
+            continue
+        
+        best_owned = max(owned, key=lambda q: QUALITY_SCORES.get(q, 0))
+        owned_score = QUALITY_SCORES.get(best_owned, 0)
+        result_score = QUALITY_SCORES.get(result.get('quality'), 0)
+        
+        # An unknown owned quality can't be beaten, so treat it as owned
+        if owned_score and result_score > owned_score:
+            result['library_status'] = 'upgrade'
+        else:
+            result['library_status'] = 'owned'
+        result['owned_quality'] = best_owned
+    
+    return results
+
+
+# Durable download queue
+#
+# /api/download only records a job in SQLite; worker threads (in every
+# gunicorn process) claim jobs with an IMMEDIATE transaction so each job runs
+# once, retry with exponential backoff, and reclaim jobs whose lease expired
+# because the process running them died. Jobs are keyed on the torrent's
+# infohash, so re-submitting a download returns the existing job.
+
+job_wakeup = threading.Event()
+job_threads = []
+
+
+def get_jobs_db():
+    """Open a connection to the job queue database"""
+    conn = sqlite3.connect(app.config['JOBS_DB_PATH'], timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_jobs_db():
+    """Create the job, search history, cache, settings and profile tables if they don't exist"""
+    conn = get_jobs_db()
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                infohash TEXT,
+                magnet TEXT NOT NULL,
+                title TEXT,
+                category TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                message TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, next_attempt_at)')
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS searches (
+                query TEXT NOT NULL,
+                category TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS profiles (
+                id TEXT PRIMARY KEY,
+                method TEXT,
+                path TEXT,
+                started REAL NOT NULL,
+                duration_ms REAL,
+                samples INTEGER,
+                stacks TEXT NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)')
+    finally:
+        conn.close()
+
+
+def extract_infohash(magnet_link):
+    """Extract the hex infohash from a magnet link, or None"""
+    match = re.search(r'xt=urn:btih:([A-Za-z0-9]+)', magnet_link or '')
+    if not match:
+        return None
+    
+    value = match.group(1)
+    if len(value) == 40:
+        return value.lower()
+    if len(value) == 32:
+        # Base32-encoded infohash
+        try:
+            return base64.b32decode(value.upper()).hex()
+        except ValueError:
+            return None
+    return None
+
+
+def job_to_dict(row):
+    """Convert a job row to an API response"""
+    job = dict(row)
+    for field in ('next_attempt_at', 'created_at', 'updated_at'):
+        job[field] = datetime.fromtimestamp(job[field]).isoformat()
+    del job['magnet']
+    del job['idempotency_key']
+    return job
+
+
+def enqueue_download_job(magnet_link, category, title):
+    """Queue a download; returns (job, created), reusing the job if this torrent is already queued"""
+    infohash = extract_infohash(magnet_link)
+    idempotency_key = infohash or hashlib.sha1(magnet_link.encode('utf-8')).hexdigest()
+    now = time.time()
+    
+    conn = get_jobs_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT * FROM jobs WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+        
+        if row and row['status'] in ('queued', 'retrying', 'running'):
+            conn.execute('COMMIT')
+            logger.info("Download already queued as job %s: %s", row['id'], title)
+            return job_to_dict(row), False
+        
+        if row:
+            # Finished jobs run again from scratch when the user asks again; if the
+            # torrent is still in qBittorrent the worker's infohash check skips the add
+            job_id = row['id']
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, next_attempt_at = ?, message = NULL, "
+                "magnet = ?, title = ?, category = ?, updated_at = ? WHERE id = ?",
+                (now, magnet_link, title, category, now, job_id)
+            )
+        else:
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, idempotency_key, infohash, magnet, title, category, status, "
+                "attempts, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'queued', 0, ?, ?, ?)",
+                (job_id, idempotency_key, infohash, magnet_link, title, category, now, now, now)
+            )
+        
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        conn.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    
+    logger.info("Queued download job %s: %s", job_id, title)
+    job_wakeup.set()
+    return job_to_dict(row), True
+
+
+def get_download_job(job_id):
+    """Look up a job by id"""
+    conn = get_jobs_db()
+    try:
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return job_to_dict(row) if row else None
+
+
+def claim_download_job():
+    """Atomically claim the next due job, or return None"""
+    now = time.time()
+    conn = get_jobs_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE (status IN ('queued', 'retrying') AND next_attempt_at <= ?) "
+            "OR (status = 'running' AND updated_at <= ?) ORDER BY next_attempt_at LIMIT 1",
+            (now, now - app.config['JOB_LEASE_SECONDS'])
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (now, row['id'])
+            )
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+        conn.execute('COMMIT')
+        return row
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def finish_download_job(job, success, message, retryable=True):
+    """Record the outcome of an attempt, scheduling a retry if attempts remain"""
+    now = time.time()
+    if success:
+        status, next_attempt_at = 'completed', now
+    elif not retryable or job['attempts'] >= app.config['JOB_MAX_ATTEMPTS']:
+        status, next_attempt_at = 'failed', now
+    else:
+        delay = min(app.config['JOB_RETRY_DELAY'] * (2 ** (job['attempts'] - 1)), 300)
+        status, next_attempt_at = 'retrying', now + delay
+    
+    conn = get_jobs_db()
+    try:
+        conn.execute(
+            'UPDATE jobs SET status = ?, next_attempt_at = ?, message = ?, updated_at = ? WHERE id = ?',
+            (status, next_attempt_at, message, now, job['id'])
+        )
+    finally:
+        conn.close()
+    
+    logger.info("Download job %s %s after %s attempt(s): %s", job['id'], status, job['attempts'], message)
+
+
+def run_download_worker():
+    """Worker loop draining the download queue"""
+    while True:
+        try:
+            job = claim_download_job()
+        except sqlite3.Error as e:
+            logger.error("Failed to claim download job: %s", e)
+            job = None
+        
+        if not job:
+            job_wakeup.wait(timeout=1)
+            job_wakeup.clear()
+            continue
+        
+        try:
+            success, message, retryable = add_torrent_to_qbittorrent(
+                job['magnet'], job['category'], job['title'], infohash=job['infohash']
+            )
+        except Exception as e:
+            success, message, retryable = False, f"Error: {str(e)}", True
+        
+        try:
+            finish_download_job(job, success, message, retryable)
+        except sqlite3.Error as e:
+            # The lease expires and another worker picks the job up again
+            logger.error("Failed to record result of job %s: %s", job['id'], e)
+
+
+def start_download_workers():
+    """Create the job table and start the worker threads once per process"""
+    if job_threads:
+        return
+    init_jobs_db()
+    for number in range(app.config['JOB_WORKERS']):
+        thread = threading.Thread(target=run_download_worker, name=f'download-worker-{number}', daemon=True)
+        thread.start()
+        job_threads.append(thread)
+
+
+# qBittorrent pool
+#
+# A collector thread keeps one logged-in session per instance and polls the
+# incremental sync API, so each poll only transfers what changed. Placement
+# reads the cached numbers and never calls qBittorrent itself.
+
+DOWNLOADING_STATES = {'downloading', 'metaDL', 'forcedDL', 'stalledDL', 'queuedDL', 'checkingDL', 'allocating'}
+
+qbittorrent_lock = threading.Lock()
+qbittorrent_stats = {}      # instance name -> cached load and health
+qbittorrent_sync = {}       # instance name -> {'session', 'rid', 'torrents'}
+qbittorrent_thread = None
+
+
+def poll_qbittorrent_instance(instance):
+    """Fetch the changes since the last poll and update the instance's cached stats"""
+    state = qbittorrent_sync.get(instance['name'])
+    if not state:
+        session = qbittorrent_login(instance)
+        if not session:
+            raise ConnectionError("login failed")
+        state = {'session': session, 'rid': 0, 'torrents': {}, 'server_state': {}}
+        qbittorrent_sync[instance['name']] = state
+    
+    response = state['session'].get(
+        f"{instance['url']}/api/v2/sync/maindata", params={'rid': state['rid']}, timeout=10
+    )
+    if response.status_code == 403:
+        # Session expired; log in again on the next poll
+        del qbittorrent_sync[instance['name']]
+        raise ConnectionError("session expired")
+    response.raise_for_status()
+    data = response.json()
+    
+    if data.get('full_update'):
+        state['torrents'] = {}
+        state['server_state'] = {}
+    for infohash, changes in data.get('torrents', {}).items():
+        state['torrents'].setdefault(infohash, {}).update(changes)
+    for infohash in data.get('torrents_removed', []):
+        state['torrents'].pop(infohash, None)
+    state['server_state'].update(data.get('server_state', {}))
+    state['rid'] = data.get('rid', 0)
+    
+    server_state = state['server_state']
+    active = sum(1 for t in state['torrents'].values() if t.get('state') in DOWNLOADING_STATES)
+    
+    with qbittorrent_lock:
+        qbittorrent_stats[instance['name']] = {
+            'healthy': True,
+            'free_space': server_state.get('free_space_on_disk'),
+            'active_torrents': active,
+            'total_torrents': len(state['torrents']),
+            'dl_speed': server_state.get('dl_info_speed', 0),
+            'up_speed': server_state.get('up_info_speed', 0),
+            'last_poll': datetime.now().isoformat(),
+            'error': None
+        }
+
+
+def mark_qbittorrent_unhealthy(instance, error):
+    """Take an instance out of placement until it answers a poll again"""
+    qbittorrent_sync.pop(instance['name'], None)
+    with qbittorrent_lock:
+        stats = qbittorrent_stats.setdefault(instance['name'], {})
+        stats['healthy'] = False
+        stats['error'] = str(error)
+        stats['last_poll'] = datetime.now().isoformat()
+
+
+def record_qbittorrent_placement(instance):
+    """Count a new torrent against an instance before the next poll sees it"""
+    with qbittorrent_lock:
+        stats = qbittorrent_stats.get(instance['name'])
+        if stats and stats.get('active_torrents') is not None:
+            stats['active_torrents'] += 1
+
+
+def run_qbittorrent_collector():
+    """Background loop refreshing the cached stats of every instance"""
+    while True:
+        for instance in app.config['QBITTORRENT_INSTANCES']:
+            try:
+                poll_qbittorrent_instance(instance)
+            except Exception as e:
+                logger.warning("qBittorrent instance %s unavailable: %s", instance['name'], e)
+                mark_qbittorrent_unhealthy(instance, e)
+        time.sleep(app.config['QBITTORRENT_POLL_INTERVAL'])
+
+
+def start_qbittorrent_collector():
+    """Start the collector thread once per process"""
+    global qbittorrent_thread
+    if qbittorrent_thread or app.config['QBITTORRENT_POLL_INTERVAL'] <= 0:
+        return
+    qbittorrent_thread = threading.Thread(target=run_qbittorrent_collector, name='qbittorrent-collector', daemon=True)
+    qbittorrent_thread.start()
+
+
+def choose_qbittorrent_instances(qb_category):
+    """Order instances for a new torrent: healthy, enough disk, category affinity, least loaded"""
+    min_free = app.config['QBITTORRENT_MIN_FREE_GB'] * 1024 ** 3
+    healthy, unhealthy = [], []
+    
+    with qbittorrent_lock:
+        for instance in app.config['QBITTORRENT_INSTANCES']:
+            # Instances the collector hasn't reached yet are assumed healthy
+            stats = qbittorrent_stats.get(instance['name'], {})
+            free_space = stats.get('free_space')
+            if free_space is not None and free_space < min_free:
+                continue
+            
+            rank = (
+                qb_category not in instance['categories'],
+                stats.get('active_torrents') or 0,
+                stats.get('dl_speed') or 0,
+                -(free_space or 0)
+            )
+            if stats.get('healthy', True):
+                healthy.append((rank, instance))
+            else:
+                unhealthy.append((rank, instance))
+    
+    # Unhealthy instances are still tried last, in case they have recovered
+    healthy.sort(key=lambda item: item[0])
+    unhealthy.sort(key=lambda item: item[0])
+    return [instance for _, instance in healthy + unhealthy]
+
+
+# Upstream response cache and predictive warm-up
+#
+# TMDb and Prowlarr responses are cached in the SQLite database, so every
+# worker and the next restart share them, with a small in-memory front. A
+# warm-up thread fills the cache ahead of demand: at startup (one process per
+# deploy) with TMDb trending lists and recently searched and downloaded titles,
+# and after each download with the title's search results and their metadata.
+# Warm-up calls are limited to WARMUP_REQUESTS_PER_MINUTE and wait while this
+# process is serving searches. Expired rows and old search history are pruned
+# every CACHE_PRUNE_INTERVAL seconds by whichever process writes to the cache.
+
+CACHE_MEMORY_BYTES = 8 * 1024 * 1024    # in-memory front, per process (JSON size)
+CACHE_PRUNE_INTERVAL = 600
+SEARCH_HISTORY_LIMIT = 1000
+
+cache_lock = threading.Lock()
+cache_memory = OrderedDict()    # key -> (expires_at, value, size in bytes)
+cache_state = {'memory_bytes': 0, 'pruned': time.time()}
+
+warmup_lock = threading.Lock()
+warmup_queue = queue.Queue(maxsize=200)
+warmup_pending = set()
+warmup_stats = {'completed': 0, 'dropped': 0, 'upstream_requests': 0}
+warmup_budget = {'tokens': 0.0, 'updated': time.time()}
+warmup_thread = None
+
+
+def cache_get(key):
+    """Look up a cached value; returns (hit, value) since None is a valid value"""
+    now = time.time()
+    with cache_lock:
+        item = cache_memory.get(key)
+        if item and item[0] > now:
+            cache_memory.move_to_end(key)
+            return True, item[1]
+    
+    try:
+        conn = get_jobs_db()
+        try:
+            row = conn.execute('SELECT value, expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Cache lookup failed: %s", e)
+        return False, None
+    
+    if not row or row['expires_at'] <= now:
+        return False, None
+    
+    value = json.loads(row['value'])
+    remember_cached(key, value, row['expires_at'], len(row['value']))
+    return True, value
+
+
+def cache_set(key, value, ttl):
+    """Store a value in the shared cache"""
+    expires_at = time.time() + ttl
+    encoded = json.dumps(value)
+    remember_cached(key, value, expires_at, len(encoded))
+    try:
+        conn = get_jobs_db()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, encoded, expires_at)
+            )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Cache write failed: %s", e)
+    
+    if time.time() - cache_state['pruned'] >= CACHE_PRUNE_INTERVAL:
+        prune_cache()
+
+
+def remember_cached(key, value, expires_at, size):
+    """Keep a value in the in-memory front of the cache, evicting the least recently used"""
+    with cache_lock:
+        old = cache_memory.pop(key, None)
+        if old:
+            cache_state['memory_bytes'] -= old[2]
+        
+        # Anything too big to share the budget stays in SQLite only
+        if size > CACHE_MEMORY_BYTES // 4:
+            return
+        
+        cache_memory[key] = (expires_at, value, size)
+        cache_state['memory_bytes'] += size
+        while cache_state['memory_bytes'] > CACHE_MEMORY_BYTES:
+            _, (_, _, evicted) = cache_memory.popitem(last=False)
+            cache_state['memory_bytes'] -= evicted
+
+
+def prune_cache():
+    """Delete expired cache rows and search history beyond what warm-up uses"""
+    now = time.time()
+    cache_state['pruned'] = now
+    try:
+        conn = get_jobs_db()
+        try:
+            conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'DELETE FROM searches WHERE created_at <= ? OR rowid NOT IN '
+                '(SELECT rowid FROM searches ORDER BY created_at DESC LIMIT ?)',
+                (now - 30 * 86400, SEARCH_HISTORY_LIMIT)
+            )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Cache pruning failed: %s", e)
+
+
+def record_search(query, category):
+    """Remember a search for the next startup warm-up"""
+    try:
+        conn = get_jobs_db()
+        try:
+            conn.execute(
+                'INSERT INTO searches (query, category, created_at) VALUES (?, ?, ?)',
+                (query, category, time.time())
+            )
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Failed to record search: %s", e)
+
+
+def schedule_warmup(kind, value, category=''):
+    """Queue a warm-up task unless the same one is already pending"""
+    if app.config['WARMUP_REQUESTS_PER_MINUTE'] <= 0 or not value:
+        return
+    
+    task = (kind, value, category or '')
+    with warmup_lock:
+        if task in warmup_pending:
+            return
+        try:
+            warmup_queue.put_nowait(task)
+        except queue.Full:
+            warmup_stats['dropped'] += 1
+            return
+        warmup_pending.add(task)
+
+
+def throttle_warmup():
+    """Hold warm-up upstream calls to the budget and behind live searches; no-op for requests"""
+    if threading.current_thread() is not warmup_thread:
+        return
+    
+    rate = app.config['WARMUP_REQUESTS_PER_MINUTE'] / 60
+    while True:
+        # Live searches in this process go first
+        with admission_condition:
+            busy = any(
+                admission_stats[request_class]['active'] or admission_stats[request_class]['waiting']
+                for request_class in ('search', 'enrichment')
+            )
+        
+        if not busy:
+            now = time.time()
+            with warmup_lock:
+                warmup_budget['tokens'] = min(
+                    warmup_budget['tokens'] + (now - warmup_budget['updated']) * rate, 1.0
+                )
+                warmup_budget['updated'] = now
+                if warmup_budget['tokens'] >= 1:
+                    warmup_budget['tokens'] -= 1
+                    warmup_stats['upstream_requests'] += 1
+                    return
+        
+        time.sleep(0.5)
+
+
+def claim_startup_warmup():
+    """Let only one process per deploy run the startup warm-up"""
+    key = 'warmup:startup'
+    now = time.time()
+    conn = get_jobs_db()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+        if row and row['expires_at'] > now:
+            conn.execute('COMMIT')
+            return False
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(datetime.now().isoformat()), now + 600)
+        )
+        conn.execute('COMMIT')
+        return True
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def schedule_startup_warmup():
+    """Queue trending lists and recently searched and downloaded titles"""
+    limit = app.config['WARMUP_HISTORY_LIMIT']
+    conn = get_jobs_db()
+    try:
+        downloads = conn.execute(
+            'SELECT title, category FROM jobs GROUP BY title ORDER BY MAX(created_at) DESC LIMIT ?',
+            (limit,)
+        ).fetchall()
+        searches = conn.execute(
+            'SELECT query, category FROM searches GROUP BY query ORDER BY MAX(created_at) DESC LIMIT ?',
+            (limit,)
+        ).fetchall()
+    finally:
+        conn.close()
+    
+    # Recent activity first, then what's popular
+    for row in downloads:
+        schedule_warmup('metadata', row['title'], row['category'])
+    for row in searches:
+        schedule_warmup('metadata', row['query'], row['category'])
+    schedule_warmup('trending', 'movie')
+    schedule_warmup('trending', 'tv')
+
+
+def warm_trending(search_type):
+    """Cache metadata for TMDb's trending titles of the week"""
+    if not app.config['TMDB_API_KEY']:
+        return
+    
+    url = f"https://api.themoviedb.org/3/trending/{search_type}/week"
+    throttle_warmup()
+    response = requests.get(url, params={'api_key': app.config['TMDB_API_KEY']}, timeout=10)
+    response.raise_for_status()
+    
+    for result in response.json().get('results', []):
+        metadata = tmdb_result_to_metadata(result, search_type)
+        year = metadata['year'] if metadata['year'] != 'Unknown' else None
+        # Torrent names may or may not carry the year, so cache both lookups
+        for key in {tmdb_cache_key(search_type, metadata['title']), tmdb_cache_key(search_type, metadata['title'], year)}:
+            cache_set(key, metadata, app.config['TMDB_CACHE_TTL'])
+
+
+def warm_related(title, category):
+    """Pre-run the searches a user makes after downloading a title, and their metadata"""
+    search_tmdb_metadata(title, category)
+    
+    # The cleaned release name is the bare title, whose results list every
+    # quality; for shows, the next season is searched as well
+    queries = [title]
+    release = parse_release_name(title)
+    if release['season'] is not None and release['title']:
+        queries.append(f"{release['title']} S{release['season'] + 1:02d}")
+    
+    for query in queries:
+        results = filter_torrents(search_prowlarr(query), {})
+        for result in results[:MAX_METADATA_RESULTS]:
+            schedule_warmup('metadata', result['title'], result['category'])
+
+
+def run_warmup_worker():
+    """Background loop working through warm-up tasks"""
+    try:
+        if claim_startup_warmup():
+            prune_cache()
+            schedule_startup_warmup()
+    except sqlite3.Error as e:
+        logger.warning("Startup warm-up skipped: %s", e)
+    
+    while True:
+        task = warmup_queue.get()
+        with warmup_lock:
+            warmup_pending.discard(task)
+        
+        kind, value, category = task
+        try:
+            if kind == 'trending':
+                warm_trending(value)
+            elif kind == 'related':
+                warm_related(value, category)
+            else:
+                search_tmdb_metadata(value, category)
+            warmup_stats['completed'] += 1
+        except Exception as e:
+            logger.warning("Warm-up task %s for '%s' failed: %s", kind, value, e)
+
+
+def start_warmup_worker():
+    """Start the warm-up thread once per process"""
+    global warmup_thread
+    if warmup_thread or app.config['WARMUP_REQUESTS_PER_MINUTE'] <= 0:
+        return
+    # Assigned before start() so throttle_warmup recognises the thread from its first call
+    warmup_thread = threading.Thread(target=run_warmup_worker, name='cache-warmup', daemon=True)
+    warmup_thread.start()
+
+
+start_library_indexer()
+start_download_workers()
+start_qbittorrent_collector()
+start_warmup_worker()
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
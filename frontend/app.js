@@ -112,6 +112,15 @@ function displayResults(results, query) {
         
         const qualityColor = qualityColors[quality] || 'bg-gray-600';
         
+        // Library badge (already on disk, on disk in a lower quality, or part of a pack on disk)
+        const libraryBadge = result.library_status === 'owned'
+            ? `<span class="text-xs px-2 py-1 bg-emerald-700 text-white rounded-full" title="Already in library (${result.owned_quality})">In Library</span>`
+            : result.library_status === 'upgrade'
+                ? `<span class="text-xs px-2 py-1 bg-amber-600 text-white rounded-full" title="In library as ${result.owned_quality}">Upgrade</span>`
+                : result.library_status === 'partial'
+                    ? `<span class="text-xs px-2 py-1 bg-sky-700 text-white rounded-full" title="${result.owned_episodes} episode file(s) in library">Partial</span>`
+                    : '';
+        
         // Seeder indicator
         const seederColor = seeders > 50 ? 'text-green-400' : seeders > 10 ? 'text-yellow-400' : 'text-red-400';
         
@@ -139,10 +148,11 @@ function displayResults(results, query) {
                                     <span class="text-sm text-gray-400">${year}</span>
                                     <span class="text-xs px-2 py-1 ${qualityColor} text-white rounded-full">${quality}</span>
                                     <span class="text-xs px-2 py-1 bg-gray-700 text-gray-300 rounded-full">${category}</span>
+                                    ${libraryBadge}
                                 </div>
                             </div>
                             <button 
-                                onclick="event.stopPropagation(); downloadTorrent('${result.magnet_link || result.download_url}', '${category}', '${displayTitle.replace(/'/g, "\\'")}')"
+                                onclick="event.stopPropagation(); downloadTorrent('${result.magnet_link || result.download_url}', '${displayTitle.replace(/'/g, "\\'")}', '${category}')"
                                 class="px-4 py-2 bg-jellyfin-purple text-white rounded-md hover:bg-jellyfin-purple-dark transition-all text-sm font-medium"
                             >
                                 Download
@@ -214,6 +224,9 @@ async function downloadTorrent(magnetLink, title, category) {
         
         if (data.success) {
             showSuccess(data.message || 'Download started successfully!');
+            if (data.job_id) {
+                watchDownloadJob(data.job_id);
+            }
         } else {
             showError(data.error || 'Download failed');
         }
@@ -223,6 +236,33 @@ async function downloadTorrent(magnetLink, title, category) {
     }
 }
 
+// Poll a queued download until qBittorrent accepts it or the job gives up
+async function watchDownloadJob(jobId, attempts = 30) {
+    for (let i = 0; i < attempts; i++) {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        
+        try {
+            const response = await fetch(`${API_URL}/api/jobs/${jobId}`);
+            if (!response.ok) {
+                return;
+            }
+            
+            const job = await response.json();
+            if (job.status === 'completed') {
+                showSuccess(job.message || 'Download started successfully!');
+                return;
+            }
+            if (job.status === 'failed') {
+                showError(job.message || 'Download failed');
+                return;
+            }
+        } catch (error) {
+            console.error('Job status error:', error);
+            return;
+        }
+    }
+}
+
 // Show success notification (Jellyfin style)
 function showSuccess(message) {
     // Create toast notification
@@ -540,7 +580,7 @@ function showTorrentDetails(title, magnetLink, category, indexer, size, seeders,
             
             <div class="flex gap-3 mt-6">
                 <button 
-                    onclick="downloadTorrent('${magnetLink}', '${category}', '${title.replace(/'/g, "\\'")}'); this.closest('.fixed').remove();"
+                    onclick="downloadTorrent('${magnetLink}', '${title.replace(/'/g, "\\'")}', '${category}'); this.closest('.fixed').remove();"
                     class="flex-1 px-4 py-2 bg-jellyfin-purple text-white rounded-md hover:bg-jellyfin-purple-dark transition-all font-medium"
                 >
                     Download